@@ -5,33 +5,36 @@
 # LICENSE file in the root directory of this source tree.
 
 import contextlib
-import math
+import os
 import sys
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial
-from itertools import chain
-from typing import Any, Optional, Union
+from typing import Any, Callable, Optional, Union
 from warnings import warn
 
 import torch
+import torch.nn.functional as F
 from omegaconf import DictConfig, ListConfig
 from torch import nn
 from torch.optim import Optimizer
 from torchdata.stateful_dataloader import StatefulDataLoader
 from torchdata.stateful_dataloader.sampler import StatefulDistributedSampler
 from torchtune import config, generation, modules, rlhf, training, utils
-from torchtune.data import padded_collate
+from torchtune.data import LengthBucketedBatchSampler, padded_collate
 from torchtune.datasets import ConcatDataset
-from torchtune.modules import local_kv_cache
+from torchtune.modules import disable_kv_cache, local_kv_cache
 from torchtune.recipe_interfaces import FTRecipeInterface
 from torchtune.rlhf import PPOStats, Trajectory
 from torchtune.training import disable_dropout, DummyProfiler, PROFILER_KEY
+from torchtune.training.activations import apply_selective_activation_checkpointing
 from torchtune.training.lr_schedulers import get_lr
 from tqdm import tqdm
 
-# enabling compile results in slightly more recompiles than the default cache limit (8)
-# so we set a higher limit here
-torch._dynamo.config.cache_size_limit = 16
+# enabling compile results in more recompiles than the default cache limit (8), since
+# the decoding step is specialized separately for prefill and decode shapes, so we set
+# a higher limit here
+torch._dynamo.config.cache_size_limit = 64
 
 
 class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
@@ -50,6 +53,12 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             come at the cost of training performance. In most cases training can slow-down quite a bit as
             a result of this activation recomputation.
 
+            Selective activation checkpointing can be enabled with ``ac_mode=selective`` and ``ac_option=op``
+            (with ``enable_activation_checkpointing=False``). This saves the outputs of matmuls and attention, and
+            only recomputes cheaper ops such as pointwise ops and norms, which is faster than checkpointing
+            entire layers at the cost of some memory. ``ac_option`` may also be an integer ``N``, which checkpoints
+            every ``N``-th layer.
+
         - Precision. Full fp32 and bf16 training are supported. Precision is controlled using the ``dtype``
             flag. When ``dtype=bf16``, all activations, gradients and optimizer states are in bfloat16. In
             most cases this should halve the memory footprint of full precision (fp32) training, without
@@ -57,10 +66,19 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             GPUs which do not support bfloat16, we fall back to fp32. Mixed precision training and fp16
             precision are currently not supported.
 
+            The reference policy and reward models are only used for inference, and can be kept in a lower
+            precision than the policy and value models using the ``frozen_dtype`` flag, e.g. ``frozen_dtype=bf16``
+            with ``dtype=fp32``. This halves their memory footprint. Defaults to ``dtype``.
+
         - Adjusting batch sizes when memory constrained. This recipe uses three different batch sizes:
             - ``batch_size`` controls the total number of samples which are sampled from the dataset for a single trajectory.
             - ``forward_batch_size`` controls the mini-batch size for trajectory generation. Since gradients are disabled
                 during trajectory generation, memory consumption is lower and this can be higher than ``ppo_batch_size``.
+            - ``scoring_batch_size`` optionally controls the mini-batch size for estimating logprobs, values, and rewards
+                with the reference policy, value, and reward models during trajectory generation. These are single forward
+                passes which don't require KV-caches, so this can usually be higher than ``forward_batch_size``, and
+                must be divisible by it. Defaults to ``forward_batch_size``. On CUDA, ``concurrent_scoring=True`` runs these
+                forward passes concurrently on separate streams, at the cost of higher peak memory.
             - ``ppo_batch_size`` controls the number of samples used for a single optimization step during PPO optimization.
                 Since we're optimizing two models at once, adjusting this parameter can have a big impact during training.
 
@@ -72,7 +90,9 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
 
             Gradient accumulation is especially useful when you are memory constrained. In this case,
             accumulating gradients might give you better training speed than enabling activation
-            checkpointing.
+            checkpointing. Otherwise, prefer ``gradient_accumulation_steps=1``: each PPO minibatch is then
+            processed with a single forward and backward pass through the policy and value models, rather
+            than several smaller micro-batches which use the GPU less efficiently.
 
         - Optimizer in Backward. Fusing the optimizer step into the backward pass helps reduce the memory
             footprint associated with gradients. This can be especially helpful when you are memory
@@ -85,6 +105,24 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             we've found that setting ``ppo_batch_size`` to the highest you can fit in memory, and `optimizer_in_bwd=True` to
             provide significant memory savings.
 
+        - KV-cache preallocation. With ``enable_kv_cache=True`` and ``tokenizer.max_seq_len`` set,
+            ``preallocate_kv_cache=True`` sets up the policy's KV-caches once, sized for
+            ``forward_batch_size`` x (``tokenizer.max_seq_len`` + ``max_generated_tokens``), and reuses them for every
+            trajectory generation. This allows the decoding step to be compiled with static shapes and captured with
+            CUDA graphs, but the KV-caches stay allocated during PPO optimisation (several GB for 7B models), and every
+            decoding step attends over the full cache length even for short prompts. Defaults to ``compile``. Otherwise,
+            KV-caches are sized for each batch of prompts and deleted after generation.
+
+        - Data loading. With ``num_workers > 0``, batches are loaded and collated in background processes, so the
+            next batch of prompts is prefetched during PPO optimisation. On CUDA, batches are collated into pinned memory
+            and copied to the device asynchronously. By default (``num_workers=0``) batches are loaded in the main
+            process; the shipped PPO configs set ``num_workers: 2``.
+
+        - CUDA graphs. With ``compile=True`` on CUDA, ``cudagraph_ppo_step=True`` captures the forward and backward
+            passes of each PPO optimisation step with CUDA graphs, removing kernel launch overhead. This requires
+            static shapes, so prompts are left-padded to ``tokenizer.max_seq_len``, which increases compute
+            when most prompts are shorter than this.
+
         - Lower precision optimizers. This recipe supports lower-precision optimizers from the bitsandbytes
             library (https://huggingface.co/docs/bitsandbytes/main/en/index). We've tested the recipe with
             8-bit AdamW and Paged AdamW. These optimizers are especially helpful when you are memory constrained
@@ -97,6 +135,9 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             Resuming training is controlled by the ``resume_from_checkpoint`` flag. Mid-epoch checkpointing is
             currently not supported.
 
+            With ``enable_async_checkpointing=True``, checkpoints are copied to CPU and written to disk in a
+            background thread, so training can continue while a checkpoint is saved.
+
             For more details on the checkpointer, please take a look at
             our checkpointer deepdive (https://pytorch.org/torchtune/main/deep_dives/checkpointer.html).
 
@@ -119,6 +160,10 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             raise RuntimeError(
                 "full fp16 training is not supported with this recipe. Please use bf16 or fp32 instead."
             )
+        # the reference policy and reward models are never trained, so they may use a lower precision
+        self._frozen_dtype = training.get_dtype(
+            cfg.get("frozen_dtype", cfg.dtype), device=self._device
+        )
 
         # logging attributes
         self._output_dir = cfg.output_dir
@@ -139,6 +184,9 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         )
         # manually setting up a generator for the recipe
         self._rng = torch.Generator(self._device).manual_seed(self.seed)
+        # permutations for shuffling trajectories during PPO optimisation are small, so they're
+        # generated on CPU to avoid launching kernels for them on device
+        self._cpu_rng = torch.Generator().manual_seed(self.seed)
         self._total_steps = 0
         self._steps_run = 0
         self._total_epochs = 0
@@ -147,7 +195,23 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
 
         # Training cfg
         self._resume_from_checkpoint = cfg.resume_from_checkpoint
+
+        # checkpoints are optionally written to disk in a background thread, so that training
+        # can continue while a checkpoint is being saved
+        self._checkpoint_executor = (
+            ThreadPoolExecutor(max_workers=1)
+            if cfg.get("enable_async_checkpointing", False)
+            else None
+        )
+        self._checkpoint_future: Optional[Future] = None
+        # persistent pinned CPU buffers which model weights are copied into for async checkpointing
+        self._pinned_state_dicts: dict[str, dict[str, torch.Tensor]] = {}
         self._gradient_accumulation_steps = cfg.gradient_accumulation_steps
+        self._optimizer_in_bwd = cfg.optimizer_in_bwd
+        self.enable_kv_cache = cfg.enable_kv_cache
+
+        # validate batch sizes before any models are loaded
+        self._setup_batch_sizes(cfg)
 
     def setup(self, cfg: DictConfig) -> None:
         """
@@ -185,7 +249,7 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         # should be called before ``_setup_optimizer`` since transforming the optimizer
         # state dict requires the model
         self.compile = cfg.compile
-        self._optimizer_in_bwd = cfg.optimizer_in_bwd
+        self._compile_backend = os.environ.get("TORCH_COMPILE_BACKEND", "inductor")
 
         (
             self._policy_model,
@@ -197,6 +261,8 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             cfg_reward_value_model=cfg.reward_and_value_model,
             enable_activation_checkpointing=cfg.enable_activation_checkpointing,
             compile_model=self.compile,
+            ac_mode=cfg.get("ac_mode", None),
+            ac_option=cfg.get("ac_option", None),
             policy_state_dict=policy_model_checkpoint_dict[training.MODEL_KEY],
             ref_policy_state_dict=ref_policy_state_dict[training.MODEL_KEY],
             value_model_state_dict=value_model_checkpoint_dict[training.MODEL_KEY],
@@ -228,40 +294,118 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             cfg_dataset=cfg.dataset,
             shuffle=cfg.shuffle,
             batch_size=cfg.batch_size,
+            num_workers=cfg.get("num_workers", 0),
+            bucket_by_length=cfg.get("bucket_by_length", False),
         )
 
         self._setup_training_parameters(cfg)
         self._setup_training_hyperparameters(cfg)
 
-        # setup a context manager for enabling KV-cacheing during
-        # trajectory generation if enabled in the config
-        self.cache_ctx_manager = lambda enable_kv_cache, decoder_max_seq_len: (
-            local_kv_cache(
-                self._policy_model,
-                batch_size=self._forward_batch_size,
-                dtype=self._dtype,
-                device=self._device,
-                decoder_max_seq_len=decoder_max_seq_len,
+        # compile the policy and value forward passes + loss used during PPO optimisation. The single-token
+        # decoding step used during trajectory generation is compiled independently below, after KV-caches are setup
+        # optionally capture the forward and backward passes of the PPO loss step with CUDA graphs to remove
+        # kernel launch overhead. CUDA graphs require static shapes, so prompts are left-padded to the
+        # tokenizer's max_seq_len, at the cost of extra compute for shorter prompts
+        self._cudagraph_ppo_step = cfg.get("cudagraph_ppo_step", False)
+        if self._cudagraph_ppo_step and (
+            not self.compile
+            or self._compile_backend != "inductor"
+            or self._device.type != "cuda"
+            or self._tokenizer.max_seq_len is None
+        ):
+            raise ValueError(
+                "cudagraph_ppo_step=True requires compile=True with the inductor backend, a CUDA device, "
+                "and tokenizer.max_seq_len to be set."
+            )
+        if self.compile:
+            # the PPO loss step is compiled as a single graph so that the pointwise ops in the loss
+            # are fused. Unless prompts are padded to a static length, shapes are left dynamic since
+            # the context length varies between batches
+            self._logger.info("Compiling PPO loss step with torch.compile...")
+            self._ppo_loss_step = torch.compile(
+                self._ppo_loss_step,
+                backend=self._compile_backend,
+                # compilation modes are only supported by inductor
+                mode=(
+                    (
+                        "max-autotune"
+                        if self._cudagraph_ppo_step
+                        else "max-autotune-no-cudagraphs"
+                    )
+                    if self._compile_backend == "inductor"
+                    else None
+                ),
+                fullgraph=True,
+                dynamic=False if self._cudagraph_ppo_step else None,
+            )
+            # trajectories always have max_generated_tokens responses, so shapes are static
+            self._mask_trajectory = torch.compile(
+                self._mask_trajectory,
+                backend=self._compile_backend,
+                fullgraph=True,
+                dynamic=False,
+            )
+
+        # optionally setup KV-caches once here, sized for the longest possible query-response, so they can
+        # be reset and reused across trajectory generations rather than being allocated and deleted on every
+        # step. This gives the decoding step static shapes for compilation, but the KV-caches stay allocated
+        # throughout PPO optimisation, so this is only done by default when compiling
+        self._kv_cache_preallocated = False
+        if (
+            self.enable_kv_cache
+            and self._tokenizer.max_seq_len is not None
+            and cfg.get("preallocate_kv_cache", self.compile)
+        ):
+            with self._device:
+                self._policy_model.setup_caches(
+                    batch_size=self._forward_batch_size,
+                    dtype=self._dtype,
+                    decoder_max_seq_len=self._tokenizer.max_seq_len
+                    + self._max_generated_tokens,
+                )
+            self._kv_cache_preallocated = True
+
+        # optionally run the reference policy, value, and reward model forward passes concurrently during
+        # trajectory generation. This increases peak memory, since all three forward passes are in-flight at once
+        self._scoring_streams = None
+        if cfg.get("concurrent_scoring", False):
+            if self._device.type != "cuda":
+                raise ValueError("concurrent_scoring=True is only supported on CUDA.")
+            self._scoring_streams = [torch.cuda.Stream() for _ in range(3)]
+
+        self._generate_next_token = None
+        if self.compile and self._kv_cache_preallocated:
+            # with static-shape KV-caches, every decoding step has identical input shapes, so the decoding
+            # step is compiled with static shapes, and on CUDA with inductor, captured with CUDA graphs to
+            # remove kernel launch overhead
+            self._generate_next_token = torch.compile(
+                generation.generate_next_token,
+                backend=self._compile_backend,
+                mode=(
+                    "reduce-overhead"
+                    if self._device.type == "cuda"
+                    and self._compile_backend == "inductor"
+                    else None
+                ),
+                fullgraph=True,
+                dynamic=False,
+            )
+            # the decoding step can also be compiled ahead of the first trajectory generation,
+            # rather than stalling the first training step
+            self._warmup_generate_next_token()
+        elif self.compile:
+            # otherwise input shapes change with the sequence length (without KV-caches) or the
+            # prompt length (with KV-caches sized per generation), so shapes are left dynamic
+            self._generate_next_token = torch.compile(
+                generation.generate_next_token, backend=self._compile_backend
             )
-            if enable_kv_cache
-            else contextlib.nullcontext()
-        )
 
         if self._resume_from_checkpoint:
             self._update_recipe_state(policy_model_checkpoint_dict)
 
         # one "step" is a single gradient update update over a minibatch of trajectories
-        self.global_step = (
-            self._steps_run
-            * self._ppo_epochs
-            * (self.batch_size // self._ppo_batch_size)
-        )
-
-        lr_steps = (
-            self._total_steps
-            * self._ppo_epochs
-            * (self.batch_size // self._ppo_batch_size)
-        )
+        self.global_step = self._steps_run * self._ppo_inner_steps
+        lr_steps = self._total_steps * self._ppo_inner_steps
 
         # Setup lr scheduler
         self._lr_scheduler = self._setup_lr_scheduler(
@@ -391,37 +535,53 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                 stop_token_ids = []
             else:
                 stop_token_ids = self._tokenizer.stop_tokens
-        self._stop_token_ids = torch.tensor(stop_token_ids, device=self._device)
+        # stop tokens are checked with ``torch.isin`` against every generated token,
+        # so keep them as a deduplicated, sorted integer tensor on device
+        self._stop_token_ids = torch.tensor(
+            sorted(set(stop_token_ids)), dtype=torch.long, device=self._device
+        )
 
-    def _setup_training_parameters(self, cfg: DictConfig) -> None:
+    def _setup_batch_sizes(self, cfg: DictConfig) -> None:
         """
-        Validates and sets up parameters for used during training and for tracking training state,
-        batch sizes for model forward passes during trajectory generation, PPO minibatches, and
+        Validates and sets up batch sizes for model forward passes during trajectory generation, PPO minibatches, and
         PPO microbatches for gradient accumulation.
 
         Raises
             - ValueError if:
                 - batch_size is not divisible by forward_batch_size
+                - batch_size is not divisible by scoring_batch_size
+                - scoring_batch_size is not divisible by forward_batch_size
                 - batch_size is not divisible by ppo_batch_size
                 - ppo_batch_size is not divisible by gradient_accumulation_steps
-                - num_steps is less than batch_size
+            - RuntimeError if:
                 - gradient_accumulation_steps > 1 and optimizer_in_bwd is True
         """
         self.batch_size = cfg.batch_size
         self._forward_batch_size = cfg.forward_batch_size
+        self._scoring_batch_size = cfg.get(
+            "scoring_batch_size", self._forward_batch_size
+        )
         self._ppo_epochs = cfg.ppo_epochs
         self._ppo_batch_size = cfg.ppo_batch_size
-        self._gradient_accumulation_steps = cfg.gradient_accumulation_steps
         self._ppo_backward_batch_size = (
             cfg.ppo_batch_size // self._gradient_accumulation_steps
         )
-        self.enable_kv_cache = cfg.enable_kv_cache
 
         if self.batch_size % self._forward_batch_size != 0:
             raise ValueError(
                 f"batch_size ({self.batch_size}) must be exactly divisible by "
                 f"forward_batch_size ({self._forward_batch_size})."
             )
+        if self.batch_size % self._scoring_batch_size != 0:
+            raise ValueError(
+                f"batch_size ({self.batch_size}) must be exactly divisible by "
+                f"scoring_batch_size ({self._scoring_batch_size})."
+            )
+        if self._scoring_batch_size % self._forward_batch_size != 0:
+            raise ValueError(
+                f"scoring_batch_size ({self._scoring_batch_size}) must be exactly divisible by "
+                f"forward_batch_size ({self._forward_batch_size})."
+            )
         if self.batch_size % self._ppo_batch_size != 0:
             raise ValueError(
                 f"batch_size ({self.batch_size}) must be exactly divisible by "
@@ -439,20 +599,32 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                 "Please set gradient_accumulation_steps=1, or optimizer_in_bwd=False."
             )
 
-        self._total_steps = cfg.num_steps // self.batch_size
-        batches_per_epoch = max(
-            1, len(self._dataloader)
-        )  # when we only have a single batch in the dataset
+        # number of PPO minibatches for every trajectory, and number of optimisation steps for every trajectory
+        self._num_micro_batches = self.batch_size // self._ppo_batch_size
+        self._ppo_inner_steps = self._ppo_epochs * self._num_micro_batches
+
+    def _setup_training_parameters(self, cfg: DictConfig) -> None:
+        """
+        Sets up parameters for tracking training state.
 
-        self._total_epochs = math.ceil(self._total_steps / batches_per_epoch)
+        Raises
+            - ValueError if:
+                - num_steps is less than batch_size
+        """
+        self._total_steps = cfg.num_steps // self.batch_size
+        batches_per_epoch = self._batches_per_epoch
+        self._total_epochs = (
+            self._total_steps + batches_per_epoch - 1
+        ) // batches_per_epoch
+        assert self._total_epochs * batches_per_epoch >= self._total_steps
         if self._total_steps == 0:
             raise ValueError(
                 f"num_steps {cfg.num_steps} must be greater than the batch size {self.batch_size}."
             )
-        if self._total_steps < len(self._dataloader):
+        if self._total_steps < batches_per_epoch:
             warn(
                 f"There are fewer total steps ({self._total_steps}, (num_steps//batch_size) "
-                f"than there are batches ({len(self._dataloader)}) in the dataset. "
+                f"than there are batches ({batches_per_epoch}) in the dataset. "
                 f"Training will stop after ({self._total_steps}) steps without saving intermediate checkpoints"
             )
         if (self._total_steps > batches_per_epoch) and (
@@ -533,6 +705,8 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         ref_policy_state_dict: dict[str, Any],
         value_model_state_dict: dict[str, Any],
         reward_model_state_dict: dict[str, Any],
+        ac_mode: Optional[str] = None,
+        ac_option: Optional[Union[int, str]] = None,
     ) -> tuple[nn.Module, nn.Module, nn.Module]:
         """
         Sets up the policy model, reference policy model, reward model, and value model.
@@ -540,17 +714,20 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
 
         with training.set_default_dtype(self._dtype), self._device:
             policy_model = config.instantiate(cfg_model)
+            value_model = config.instantiate(cfg_reward_value_model)
+
+        with training.set_default_dtype(self._frozen_dtype), self._device:
             ref_policy_model = config.instantiate(cfg_model)
             reward_model = config.instantiate(cfg_reward_value_model)
-            value_model = config.instantiate(cfg_reward_value_model)
 
-        if compile_model:
-            training.compile_model(policy_model)
-            training.compile_model(ref_policy_model)
-            training.compile_model(value_model)
-            training.compile_model(reward_model)
+        # ``enable_activation_checkpointing`` checkpoints entire layers, whilst ``ac_mode`` and ``ac_option``
+        # together control selective AC. Selective AC is only enabled when ``enable_activation_checkpointing``
+        # is set to False
+        if (not enable_activation_checkpointing) and (ac_mode is not None):
+            apply_selective_activation_checkpointing(policy_model, ac_mode, ac_option)
+            apply_selective_activation_checkpointing(value_model, ac_mode, ac_option)
 
-        if enable_activation_checkpointing:
+        if enable_activation_checkpointing and ac_mode is None:
             training.set_activation_checkpointing(
                 policy_model, auto_wrap_policy={modules.TransformerSelfAttentionLayer}
             )
@@ -558,6 +735,31 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                 value_model, auto_wrap_policy={modules.TransformerSelfAttentionLayer}
             )
 
+        # activation checkpointing must be applied before compiling, so that each layer is only
+        # wrapped by a single checkpoint wrapper. The policy and value models are not compiled here
+        # since they alternate between trajectory generation and training, which causes recompiles -
+        # the decoding step and the PPO loss step are compiled separately in ``setup``.
+        # The reference policy and reward models are only used for inference, so they are compiled
+        # as whole models rather than per-layer, allowing fusion across layer boundaries and the output projection
+        if compile_model:
+            self._logger.info(
+                "Compiling reference policy and reward models with torch.compile..."
+            )
+            ref_policy_model.compile(backend=self._compile_backend)
+            reward_model.compile(backend=self._compile_backend)
+
+        # cast checkpoint weights to the dtype of each model before loading them, replacing the original tensors
+        # so that full precision copies of the weights aren't held in host memory for the rest of setup
+        for state_dict, dtype in (
+            (policy_state_dict, self._dtype),
+            (value_model_state_dict, self._dtype),
+            (ref_policy_state_dict, self._frozen_dtype),
+            (reward_model_state_dict, self._frozen_dtype),
+        ):
+            for k, v in state_dict.items():
+                if torch.is_floating_point(v):
+                    state_dict[k] = v.to(dtype)
+
         policy_model.load_state_dict(policy_state_dict)
         ref_policy_model.load_state_dict(ref_policy_state_dict)
 
@@ -582,16 +784,19 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             value_model.named_parameters(), dtype=self._dtype
         )
         training.validate_expected_param_dtype(
-            reward_model.named_parameters(), dtype=self._dtype
+            reward_model.named_parameters(), dtype=self._frozen_dtype
         )
         training.validate_expected_param_dtype(
-            value_model.named_parameters(), dtype=self._dtype
+            policy_model.named_parameters(), dtype=self._dtype
         )
         training.validate_expected_param_dtype(
-            ref_policy_model.named_parameters(), dtype=self._dtype
+            ref_policy_model.named_parameters(), dtype=self._frozen_dtype
         )
 
-        self._logger.info(f"Models are initialized with precision {self._dtype}.")
+        self._logger.info(
+            f"Policy and value models are initialized with precision {self._dtype}. "
+            f"Reference policy and reward models are initialized with precision {self._frozen_dtype}."
+        )
 
         # disabling dropout if found - non-determinism leads to issues in e.g. comparing logprobs
         # between ref policy and current policy
@@ -620,14 +825,13 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         optimizer_in_bwd: bool = False,
         opt_state_dict: Optional[dict[str, Any]] = None,
     ) -> Optimizer:
+        params = [
+            *self._policy_model.parameters(),
+            *self._value_model.parameters(),
+        ]
         if optimizer_in_bwd:
             # Maintain a dict of optims for every parameter.
-            optim_dict = {
-                p: config.instantiate(cfg_optimizer, [p])
-                for p in chain(
-                    self._policy_model.parameters(), self._value_model.parameters()
-                )
-            }
+            optim_dict = {p: config.instantiate(cfg_optimizer, [p]) for p in params}
             # Register optimizer step hooks on the models to run optimizer in backward.
             training.register_optim_in_bwd_hooks(
                 model=self._policy_model, optim_dict=optim_dict
@@ -635,12 +839,11 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             training.register_optim_in_bwd_hooks(
                 model=self._value_model, optim_dict=optim_dict
             )
-            # Create a wrapper for checkpoint save/load of optimizer states when running in backward.
+            # Create a single wrapper for checkpoint save/load of optimizer states for both the policy
+            # and value models when running in backward.
             self._optim_ckpt_wrapper = training.create_optim_in_bwd_wrapper(
-                model=self._policy_model, optim_dict=optim_dict
-            )
-            self._optim_ckpt_wrapper = training.create_optim_in_bwd_wrapper(
-                model=self._value_model, optim_dict=optim_dict
+                model=nn.ModuleList([self._policy_model, self._value_model]),
+                optim_dict=optim_dict,
             )
             # Load optimizer states. If optimizer states are being restored in an optimizer in backward
             # run, these need to have been saved with the same setting. Cannot restore from runs that did not
@@ -656,10 +859,7 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             self._logger.info("In-backward optimizers are set up.")
             return None
         else:
-            optimizer = config.instantiate(
-                cfg_optimizer,
-                chain(self._policy_model.parameters(), self._value_model.parameters()),
-            )
+            optimizer = config.instantiate(cfg_optimizer, params)
             if opt_state_dict:
                 optimizer.load_state_dict(opt_state_dict)
 
@@ -667,10 +867,21 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             return optimizer
 
     def _setup_data(
-        self, cfg_dataset: DictConfig, shuffle: bool, batch_size: int
+        self,
+        cfg_dataset: DictConfig,
+        shuffle: bool,
+        batch_size: int,
+        num_workers: int = 0,
+        bucket_by_length: bool = False,
     ) -> StatefulDataLoader:
         """
-        All data related setup happens here.
+        All data related setup happens here. When ``num_workers > 0``, batches are loaded and collated
+        in background worker processes, so that the next batch is ready as soon as trajectory generation starts.
+        On CUDA, batches are collated into pinned memory so they can be copied to the device asynchronously.
+
+        If ``bucket_by_length=True``, prompts of similar lengths are grouped into the same batch using
+        :class:`~torchtune.data.LengthBucketedBatchSampler`, which reduces the amount of left-padding in each batch.
+        This requires tokenizing the whole dataset once to find the length of each prompt.
         """
         if isinstance(cfg_dataset, ListConfig):
             datasets = [
@@ -687,11 +898,35 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             rank=0,
             shuffle=shuffle,
         )
+        if bucket_by_length:
+            self._logger.info(
+                "Computing prompt lengths for length-bucketed batching..."
+            )
+            sampler = LengthBucketedBatchSampler(
+                sampler,
+                lengths=[len(ds[idx]["tokens"]) for idx in range(len(ds))],
+                batch_size=batch_size,
+                drop_last=True,
+                shuffle=shuffle,
+                seed=self.seed,
+            )
+            batching_kwargs = {"batch_sampler": sampler}
+        else:
+            batching_kwargs = {
+                "sampler": sampler,
+                "batch_size": batch_size,
+                "drop_last": True,
+            }
+        # keep a reference to the sampler to update its epoch during training
+        self._sampler = sampler
+
         dataloader = StatefulDataLoader(
             dataset=ds,
-            sampler=sampler,
-            batch_size=batch_size,
-            drop_last=True,
+            **batching_kwargs,
+            num_workers=num_workers,
+            pin_memory=self._device.type == "cuda",
+            persistent_workers=num_workers > 0,
+            prefetch_factor=2 if num_workers > 0 else None,
             collate_fn=partial(
                 padded_collate,
                 pad_direction="left",
@@ -699,6 +934,10 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                 padding_idx=self._tokenizer.pad_id,
             ),
         )
+        # computing the length of the dataloader may iterate over the sampler, so only do this once
+        self._batches_per_epoch = max(
+            1, len(dataloader)
+        )  # when we only have a single batch in the dataset
 
         return dataloader
 
@@ -708,7 +947,15 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         """
         Save state dict to file. The recipe save_checkpoint method is responsible for
         correctly creating the checkpoint dict and passing to the checkpointer.
+
+        If ``enable_async_checkpointing=True``, a copy of the checkpoint is taken on CPU, and written
+        to disk in a background thread. Only one checkpoint is written at a time. On CUDA, model weights
+        are copied asynchronously into pinned CPU buffers which are reused across checkpoints, and the
+        background thread waits for the copy to finish before writing them.
         """
+        # wait for any previous checkpoint to finish saving
+        self._wait_for_checkpoint()
+
         policy_ckpt_dict = {training.MODEL_KEY: self._policy_model.state_dict()}
         value_ckpt_dict = {training.MODEL_KEY: self._value_model.state_dict()}
 
@@ -722,6 +969,7 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                     training.MAX_STEPS_KEY: self._total_steps,
                     training.STEPS_KEY: self._steps_run,
                     training.RNG_KEY: self._rng.get_state(),
+                    training.CPU_RNG_KEY: self._cpu_rng.get_state(),
                     training.DATALOADER_KEY: self._dataloader.state_dict(),
                 }
             )
@@ -732,6 +980,53 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                     training.OPT_KEY
                 ] = self._optim_ckpt_wrapper.state_dict()
 
+        if self._checkpoint_executor is None:
+            self._save_checkpoint_dicts(
+                policy_ckpt_dict, value_ckpt_dict, epoch, is_intermediate_checkpoint
+            )
+            return
+
+        # model and optimizer states are updated in-place during training, so snapshot them before saving
+        policy_model_state = policy_ckpt_dict.pop(training.MODEL_KEY)
+        value_model_state = value_ckpt_dict.pop(training.MODEL_KEY)
+        copy_done = None
+        if self._device.type == "cuda":
+            policy_model_state = self._copy_to_pinned_buffers(
+                "policy", policy_model_state
+            )
+            value_model_state = self._copy_to_pinned_buffers("value", value_model_state)
+            copy_done = torch.cuda.Event()
+            copy_done.record()
+        else:
+            policy_model_state = self._copy_to_cpu(policy_model_state)
+            value_model_state = self._copy_to_cpu(value_model_state)
+
+        self._checkpoint_future = self._checkpoint_executor.submit(
+            self._save_checkpoint_dicts,
+            {training.MODEL_KEY: policy_model_state}
+            | self._copy_to_cpu(policy_ckpt_dict),
+            {training.MODEL_KEY: value_model_state}
+            | self._copy_to_cpu(value_ckpt_dict),
+            epoch,
+            is_intermediate_checkpoint,
+            copy_done,
+        )
+
+    def _save_checkpoint_dicts(
+        self,
+        policy_ckpt_dict: dict[str, Any],
+        value_ckpt_dict: dict[str, Any],
+        epoch: int,
+        is_intermediate_checkpoint: bool,
+        copy_done: Optional[torch.cuda.Event] = None,
+    ) -> None:
+        """
+        Writes the policy and value checkpoint dicts to disk using their checkpointers,
+        after waiting for ``copy_done`` if any tensors are still being copied to CPU.
+        """
+        if copy_done is not None:
+            copy_done.synchronize()
+
         self._policy_checkpointer.save_checkpoint(
             policy_ckpt_dict,
             epoch=epoch,
@@ -744,6 +1039,45 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             intermediate_checkpoint=False,
         )
 
+    def _copy_to_cpu(self, obj: Any) -> Any:
+        """
+        Recursively copies all tensors in a (possibly nested) checkpoint dict to CPU.
+        """
+        if isinstance(obj, torch.Tensor):
+            return obj.detach().to("cpu", copy=True)
+        if isinstance(obj, dict):
+            return {k: self._copy_to_cpu(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._copy_to_cpu(v) for v in obj)
+        return obj
+
+    def _copy_to_pinned_buffers(
+        self, name: str, state_dict: dict[str, torch.Tensor]
+    ) -> dict[str, torch.Tensor]:
+        """
+        Copies a model state dict into persistent pinned CPU buffers without blocking. The buffers for
+        each ``name`` are allocated on the first checkpoint and reused afterwards, which is safe since a
+        checkpoint is only taken once the previous one has been written.
+        """
+        if name not in self._pinned_state_dicts:
+            self._pinned_state_dicts[name] = {
+                k: torch.empty_like(v, device="cpu", pin_memory=True)
+                for k, v in state_dict.items()
+            }
+        pinned_state_dict = self._pinned_state_dicts[name]
+        for k, v in state_dict.items():
+            pinned_state_dict[k].copy_(v.detach(), non_blocking=True)
+        return dict(pinned_state_dict)
+
+    def _wait_for_checkpoint(self) -> None:
+        """
+        Blocks until any checkpoint being saved in the background has been written,
+        re-raising any exception raised while saving it.
+        """
+        if self._checkpoint_future is not None:
+            self._checkpoint_future.result()
+            self._checkpoint_future = None
+
     def _update_recipe_state(self, ckpt_dict: dict[str, Any]) -> None:
         """
         Updates the recipe state from checkpoint.
@@ -762,6 +1096,11 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                 )
             self.seed = training.set_seed(seed=ckpt_dict[training.SEED_KEY])
             self._rng.set_state(ckpt_dict[training.RNG_KEY])
+            # checkpoints saved before the CPU rng state was checkpointed fall back to re-seeding it
+            if training.CPU_RNG_KEY in ckpt_dict:
+                self._cpu_rng.set_state(ckpt_dict[training.CPU_RNG_KEY])
+            else:
+                self._cpu_rng.manual_seed(self.seed)
             self._steps_run = ckpt_dict[training.STEPS_KEY]
             self._total_steps = ckpt_dict[training.MAX_STEPS_KEY]
             self._total_epochs = ckpt_dict[training.TOTAL_EPOCHS_KEY]
@@ -773,18 +1112,79 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                 "Are you sure you passed in the right recipe checkpoint?"
             )
 
+    def _warmup_generate_next_token(self) -> None:
+        """
+        Compiles the decoding step for the shapes used during trajectory generation by generating from dummy prompts,
+        both with and without left-padding, since these produce causal masks with different batch dimensions.
+        A separate generator is used for sampling so that the recipe's RNG state is left untouched.
+        """
+        self._logger.info("Compiling the decoding step for trajectory generation...")
+        t0 = time.perf_counter()
+        rng = torch.Generator(self._device).manual_seed(0)
+        pad_id = self._tokenizer.pad_id
+        # only the shapes of the prompts matter, so any non-padding token can be used
+        token_id = 0 if pad_id != 0 else 1
+        prompts = [
+            torch.full((self._forward_batch_size, 1), token_id, device=self._device),
+            torch.tensor([[pad_id, token_id]], device=self._device).expand(
+                self._forward_batch_size, -1
+            ),
+        ]
+        with torch.no_grad():
+            for prompt in prompts:
+                with self.cache_ctx_manager():
+                    generation.generate(
+                        model=self._policy_model,
+                        prompt=prompt,
+                        max_generated_tokens=2,
+                        temperature=self._temperature,
+                        top_k=self._top_k,
+                        pad_id=pad_id,
+                        rng=rng,
+                        custom_generate_next_token=self._generate_next_token,
+                    )
+        self._logger.info(
+            f"Decoding step compiled in {time.perf_counter() - t0:.2f} seconds."
+        )
+
+    @contextlib.contextmanager
+    def cache_ctx_manager(self, decoder_max_seq_len: Optional[int] = None):
+        """
+        Context manager for enabling KV-cacheing on the policy model during trajectory generation, if enabled
+        in the config. Pre-allocated KV-caches are reset in-place, otherwise KV-caches are setup with the
+        given ``decoder_max_seq_len`` and deleted on exit.
+
+        Args:
+            decoder_max_seq_len (Optional[int]): maximum sequence length of the KV-caches, if they are not
+                pre-allocated.
+        """
+        if not self.enable_kv_cache:
+            yield
+        elif self._kv_cache_preallocated:
+            self._policy_model.reset_caches()
+            yield
+        else:
+            with local_kv_cache(
+                self._policy_model,
+                batch_size=self._forward_batch_size,
+                dtype=self._dtype,
+                device=self._device,
+                decoder_max_seq_len=decoder_max_seq_len,
+            ):
+                yield
+
     def generate_trajectory(self, input_ids: torch.Tensor) -> Trajectory:
         """
         Generates a trajectory given the current policy and value models, the reference policy model, the reward model,
         and batch of inputs. This is done over the following steps:
 
         1: Generate responses, and logits corresponding to the responses using the current policy,
-            generating (query, response) pairs.
+            generating (query, response) pairs. This is done in ``self._forward_batch_size`` batch sizes.
         2. Estimate logprobs of the generated responses using the current policy.
         3. Estimate values from the generated responses using the current value function.
-        4. Replace any tokens in the response after the first stop token (usually EOS token) with padding,
-            producting truncated responses.
-        5. Run the reward model on the (query, truncated-response) pairs.
+        4. Treat any tokens in the response after the first stop token (usually EOS token) as padding,
+            producing truncated responses.
+        5. Score the (query, truncated-response) pairs using the reward model.
         6. Mask out all the invalid values in the trajectory due to padding tokens.
 
         Args:
@@ -796,20 +1196,28 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         """
         _, context_length = input_ids.shape
         # step 1: generate responses, and logits corresponding to the responses using the current policy
-        with self.cache_ctx_manager(
-            self.enable_kv_cache,
-            decoder_max_seq_len=context_length + self._max_generated_tokens,
-        ):
-            query_responses, logits = generation.generate(
-                model=self._policy_model,
-                prompt=input_ids,
-                max_generated_tokens=self._max_generated_tokens,
-                temperature=self._temperature,
-                top_k=self._top_k,
-                pad_id=self._tokenizer.pad_id,
-                rng=self._rng,
-            )
-        responses = query_responses[:, context_length:].clone()
+        generated: list[tuple[torch.Tensor, torch.Tensor]] = []
+        for batch_start in range(0, input_ids.shape[0], self._forward_batch_size):
+            with self.cache_ctx_manager(
+                decoder_max_seq_len=context_length + self._max_generated_tokens,
+            ):
+                generated.append(
+                    generation.generate(
+                        model=self._policy_model,
+                        prompt=input_ids[
+                            batch_start : batch_start + self._forward_batch_size
+                        ],
+                        max_generated_tokens=self._max_generated_tokens,
+                        temperature=self._temperature,
+                        top_k=self._top_k,
+                        pad_id=self._tokenizer.pad_id,
+                        rng=self._rng,
+                        custom_generate_next_token=self._generate_next_token,
+                    )
+                )
+        query_responses, logits = map(torch.cat, zip(*generated))
+        del generated
+        responses = query_responses[:, context_length:]
         query_response_padding_masks = query_responses != self._tokenizer.pad_id
 
         # step 1.1 create attention masks and position IDs for any padding tokens in inputs, used for future forward passes
@@ -827,39 +1235,47 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
 
         del logits
 
-        # step 2.1 estimate logprobs of the responses using the reference policy
-        ref_logits = self._ref_policy_model(
-            query_responses, input_pos=position_ids, mask=masks
+        # step 4. find any tokens in the responses after the first stop token (usually EOS token), which
+        # are treated as padding. Truncation is done in-place, so a copy of the responses is truncated
+        response_padding_masks, _ = rlhf.truncate_sequence_at_first_stop_token(
+            responses.clone(), self._stop_token_ids, self._tokenizer.pad_id
         )
-        ref_logits = rlhf.truncate_sequence_for_logprobs(ref_logits, context_length)
-        ref_logprobs = rlhf.logits_to_logprobs(ref_logits, responses, self._temperature)
+        seq_lens = training.get_unmasked_sequence_lengths(response_padding_masks)
+        # index of the last non-padding token in each (query, truncated-response) pair, shape [b, 1, 1]
+        score_idxs = (seq_lens + context_length)[:, None, None]
 
-        del ref_logits
+        # step 2.1 estimate logprobs of the responses using the reference policy
+        def ref_policy_forward() -> torch.Tensor:
+            ref_logits = self._ref_policy_model(
+                query_responses, input_pos=position_ids, mask=masks
+            )
+            ref_logits = rlhf.truncate_sequence_for_logprobs(ref_logits, context_length)
+            # if the reference policy is in a lower precision, compute logprobs in the policy's
+            # precision so that KL estimates against the policy's logprobs aren't dominated by rounding errors
+            ref_logits = ref_logits.to(self._dtype)
+            return rlhf.logits_to_logprobs(ref_logits, responses, self._temperature)
 
         # step 3. estimate values from the responses using the value function
-        values = self._value_model(query_responses, input_pos=position_ids, mask=masks)
-        values = rlhf.truncate_sequence_for_logprobs(values, context_length).squeeze(-1)
+        def value_forward() -> torch.Tensor:
+            values = self._value_model(
+                query_responses, input_pos=position_ids, mask=masks
+            )
+            return rlhf.truncate_sequence_for_logprobs(values, context_length).squeeze(
+                -1
+            )
 
-        # step 4. replace any tokens in the responses after the first stop token (usually EOS token) with padding
-        # resulting in truncated responses
-        response_padding_masks, responses = rlhf.truncate_sequence_at_first_stop_token(
-            responses, self._stop_token_ids, self._tokenizer.pad_id
-        )
+        # step 5. run the reward model on the (query, response) pairs. Only the score at the last valid token
+        # of each response is used, and with causal masks this doesn't depend on any tokens after it, so there's
+        # no need to replace tokens after the first stop token with padding
+        def reward_forward() -> torch.Tensor:
+            scores = self._reward_model(
+                query_responses, input_pos=position_ids, mask=masks
+            )
+            # step 5.1 the scores from the reward model are the logits for the last non-padding token
+            return scores.gather(1, score_idxs).squeeze((-1, -2)).to(self._dtype)
 
-        # step 5. run the reward model on the (query, truncated-response) pairs
-        scores = self._reward_model(
-            torch.cat([input_ids, responses], dim=1),
-            input_pos=position_ids,
-            mask=masks,
-        )
-
-        del responses
-
-        # step 5.1 the scores from the reward model are the logits for the last non-padding token in
-        # each (query, truncated-response) pair
-        seq_lens = training.get_unmasked_sequence_lengths(response_padding_masks)
-        scores = scores.gather(1, (seq_lens + context_length)[:, None, None]).squeeze(
-            (-1, -2)
+        ref_logprobs, values, scores = self._run_scoring_forwards(
+            ref_policy_forward, value_forward, reward_forward
         )
 
         # step 5.2 if configured, apply any penalties for sequences without EOS tokens
@@ -874,20 +1290,9 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             scores[reward_penalty_mask] = self._reward_penalty
 
         # step 6. mask out all the invalid values in the trajectory due to padding tokens
-        logprobs[response_padding_masks] = 1.0
-        ref_logprobs[response_padding_masks] = 1.0
-
-        # step 6.1 values are masked out *after* the last valid token in the response
-        value_seq_idxs = torch.where(
-            (seq_lens > 0) & (seq_lens < self._max_generated_tokens - 1),
-            seq_lens + 1,
-            seq_lens,
-        )
-        value_padding_masks = response_padding_masks.clone()
-        value_padding_masks = value_padding_masks.scatter_(
-            1, value_seq_idxs.unsqueeze(-1), False
+        value_padding_masks, value_seq_idxs = self._mask_trajectory(
+            logprobs, ref_logprobs, values, response_padding_masks, seq_lens
         )
-        values[value_padding_masks] = 0.0
 
         return Trajectory(
             query_responses=query_responses,
@@ -903,9 +1308,78 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             seq_lens=seq_lens,
         )
 
+    def _mask_trajectory(
+        self,
+        logprobs: torch.Tensor,
+        ref_logprobs: torch.Tensor,
+        values: torch.Tensor,
+        response_padding_masks: torch.Tensor,
+        seq_lens: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Masks out invalid logprobs and values in a trajectory due to padding tokens, in-place.
+        This is compiled in ``setup`` if ``compile=True`` so the masking ops are fused.
+
+        Args:
+            logprobs (torch.Tensor): logprobs of the responses under the current policy, shape [b, response_len]
+            ref_logprobs (torch.Tensor): logprobs of the responses under the reference policy, shape [b, response_len]
+            values (torch.Tensor): estimated values of the responses, shape [b, response_len]
+            response_padding_masks (torch.Tensor): boolean mask where True indicates padding after the first stop token,
+                shape [b, response_len]
+            seq_lens (torch.Tensor): index of the last valid token in each response, shape [b]
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor]: value padding masks, where True indicates values which have been
+                masked out, and the indexes of the last valid value in each response.
+        """
+        logprobs.masked_fill_(response_padding_masks, 1.0)
+        ref_logprobs.masked_fill_(response_padding_masks, 1.0)
+
+        # values are masked out *after* the last valid token in the response, i.e. the index is shifted
+        # by one unless the response is empty or the shifted index would fall outside the response
+        value_seq_idxs = seq_lens + (
+            (seq_lens > 0) & (seq_lens < self._max_generated_tokens - 1)
+        ).to(seq_lens.dtype)
+        value_padding_masks = response_padding_masks.clone().scatter_(
+            1, value_seq_idxs.unsqueeze(-1), False
+        )
+        values.masked_fill_(value_padding_masks, 0.0)
+        return value_padding_masks, value_seq_idxs
+
+    def _run_scoring_forwards(
+        self, *forward_fns: Callable[[], torch.Tensor]
+    ) -> list[torch.Tensor]:
+        """
+        Runs the independent reference policy, value, and reward model forward passes used to score a trajectory.
+        If ``concurrent_scoring=True``, each forward pass is launched on its own CUDA stream so that they can overlap.
+
+        Args:
+            *forward_fns (Callable[[], torch.Tensor]): functions which each run a single model forward pass.
+
+        Returns:
+            list[torch.Tensor]: the outputs of each function in ``forward_fns``.
+        """
+        if self._scoring_streams is None:
+            return [forward_fn() for forward_fn in forward_fns]
+
+        current_stream = torch.cuda.current_stream()
+        outputs = []
+        for forward_fn, stream in zip(forward_fns, self._scoring_streams):
+            # inputs are produced on the current stream
+            stream.wait_stream(current_stream)
+            with torch.cuda.stream(stream):
+                outputs.append(forward_fn())
+        for stream in self._scoring_streams:
+            current_stream.wait_stream(stream)
+        # outputs were allocated on the scoring streams but are consumed on the current stream,
+        # so they mustn't be reused by the allocator until the current stream is done with them
+        for output in outputs:
+            output.record_stream(current_stream)
+        return outputs
+
     def generate_trajectory_batched(self, input_ids: torch.Tensor) -> Trajectory:
         """
-        Generates a self.batch_size batch of trajectories using self._forward_batch_size batch sizes.
+        Generates a self.batch_size batch of trajectories using self._scoring_batch_size batch sizes.
         See generate_trajectory for more details.
 
         Args:
@@ -915,15 +1389,33 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             Trajectory: An instance of :class:`~torchtune.rlhf.Trajectory`, comprising
                 the current trajectory.
         """
-        trajectories: list[Trajectory] = []
+        if self._scoring_batch_size == self.batch_size:
+            with torch.no_grad():
+                return self.generate_trajectory(input_ids)
+
+        trajectory: Optional[Trajectory] = None
         with torch.no_grad():
-            for batch_start in range(0, self.batch_size, self._forward_batch_size):
+            for batch_start in range(0, self.batch_size, self._scoring_batch_size):
                 batch_input_ids = input_ids[
-                    batch_start : batch_start + self._forward_batch_size
+                    batch_start : batch_start + self._scoring_batch_size
                 ]
 
-                trajectories.append(self.generate_trajectory(batch_input_ids))
-        return Trajectory(*map(torch.cat, zip(*trajectories)))
+                batch_trajectory = self.generate_trajectory(batch_input_ids)
+                # the sequence length depends on the longest prompt in the batch, so the
+                # full trajectory is allocated from the first sub-trajectory and filled in-place
+                if trajectory is None:
+                    trajectory = Trajectory(
+                        *(
+                            field.new_empty((self.batch_size, *field.shape[1:]))
+                            for field in batch_trajectory
+                        )
+                    )
+                for field, batch_field in zip(trajectory, batch_trajectory):
+                    field[batch_start : batch_start + self._scoring_batch_size].copy_(
+                        batch_field
+                    )
+                del batch_trajectory
+        return trajectory
 
     def train(self) -> None:
         """
@@ -939,7 +1431,7 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         for curr_epoch in range(self._epochs_run, self._total_epochs):
             # Update the sampler to ensure data is correctly shuffled across epochs
             # in case shuffle is True
-            self._dataloader.sampler.set_epoch(curr_epoch)
+            self._sampler.set_epoch(curr_epoch)
             for idx, batch in enumerate(self._dataloader):
                 # Start tracking CUDA memory for active steps for just the first epoch
                 if (
@@ -950,7 +1442,13 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                 ):
                     torch.cuda.memory._record_memory_history()
 
-                batch = batch["tokens"].to(self._device)
+                batch = batch["tokens"].to(self._device, non_blocking=True)
+                if self._cudagraph_ppo_step:
+                    batch = F.pad(
+                        batch,
+                        (self._tokenizer.max_seq_len - batch.shape[1], 0),
+                        value=self._tokenizer.pad_id,
+                    )
                 _, context_length = batch.shape
                 num_tokens = batch.numel()
 
@@ -979,41 +1477,51 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
 
                 # # step 4. optimise using the PPO objective over multiple epochs
                 t0_ppo = time.perf_counter()
-                ppo_stats: list[PPOStats] = []
+                # stats for every optimisation step are accumulated in-place across micro-batches
+                ppo_stats = torch.zeros(
+                    self._ppo_inner_steps, len(PPOStats._fields), device=self._device
+                )
+                inner_step = 0
                 for _ in range(self._ppo_epochs):
-                    batch_idxs = torch.randperm(self.batch_size, device=self._device)
+                    # shuffle the trajectory once per epoch, so that mini-batches and micro-batches
+                    # can be taken as contiguous slices rather than gathered for every backward pass
+                    batch_idxs = torch.randperm(
+                        self.batch_size, generator=self._cpu_rng
+                    )
+                    if self._device.type == "cuda":
+                        batch_idxs = batch_idxs.pin_memory()
+                    batch_idxs = batch_idxs.to(self._device, non_blocking=True)
+                    shuffled_trajectory = Trajectory(
+                        *map(
+                            partial(torch.index_select, dim=0, index=batch_idxs),
+                            trajectory,
+                        )
+                    )
+                    shuffled_advantages = advantages[batch_idxs]
+                    shuffled_returns = returns[batch_idxs]
                     for i in range(0, self.batch_size, self._ppo_batch_size):
-                        mini_batch_idxs = batch_idxs[i : i + self._ppo_batch_size]
-
-                        batch_ppo_stats: list[PPOStats] = []
                         for j in range(
-                            0, self._ppo_batch_size, self._ppo_backward_batch_size
+                            i,
+                            i + self._ppo_batch_size,
+                            self._ppo_backward_batch_size,
                         ):
-                            backward_batch_idxs = mini_batch_idxs[
-                                j : j + self._ppo_backward_batch_size
-                            ]
-
-                            batch_trajectory = Trajectory(
-                                *map(
-                                    partial(
-                                        torch.index_select,
-                                        dim=0,
-                                        index=backward_batch_idxs,
-                                    ),
-                                    trajectory,
-                                )
+                            backward_batch_slice = slice(
+                                j, j + self._ppo_backward_batch_size
                             )
-                            batch_ppo_stats.append(
-                                self.ppo_step(
-                                    batch_trajectory,
-                                    advantages[backward_batch_idxs],
-                                    returns[backward_batch_idxs],
-                                    context_length,
-                                )
+                            batch_ppo_stats = self.ppo_step(
+                                Trajectory(
+                                    *(
+                                        t[backward_batch_slice]
+                                        for t in shuffled_trajectory
+                                    )
+                                ),
+                                shuffled_advantages[backward_batch_slice],
+                                shuffled_returns[backward_batch_slice],
+                                context_length,
                             )
-                            del batch_trajectory
-
-                        ppo_stats.append(PPOStats(*map(sum, zip(*batch_ppo_stats))))
+                            with torch.no_grad():
+                                ppo_stats[inner_step].add_(torch.stack(batch_ppo_stats))
+                            del batch_ppo_stats
 
                         if not self._optimizer_in_bwd:
                             self._optimizer.step()
@@ -1023,6 +1531,9 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                         if self._lr_scheduler is not None:
                             self._lr_scheduler.step()
                         self.global_step += 1
+                        inner_step += 1
+
+                    del shuffled_trajectory, shuffled_advantages, shuffled_returns
 
                 ppo_time = time.perf_counter() - t0_ppo
 
@@ -1039,16 +1550,16 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
                 if self._steps_run % self._log_every_n_steps == 0:
                     self.log_metrics(
                         trajectory,
-                        PPOStats(*map(torch.stack, zip(*ppo_stats))),
+                        PPOStats(*ppo_stats.unbind(-1)),
                         kl,
                         kl_rewards,
                         num_tokens / traj_time,
                         num_tokens / ppo_time,
                         current_lr,
                     )
-                self.cleanup_after_step(
-                    trajectory, ppo_stats, advantages, returns, kl, kl_rewards
-                )
+                # drop references to this step's tensors before the next trajectory is generated, so their
+                # memory can be reused by the caching allocator rather than being held alongside the next step's
+                del trajectory, ppo_stats, advantages, returns, rewards, kl, kl_rewards
                 pbar.update(1)
 
                 # Stop tracking CUDA memory now that active steps are complete
@@ -1082,15 +1593,24 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
 
         self._profiler.stop()
 
-    def ppo_step(
+    def _ppo_loss_step(
         self,
         trajectory: Trajectory,
         advantages: torch.Tensor,
         returns: torch.Tensor,
         context_length: int,
-    ) -> PPOStats:
+    ) -> tuple[
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+    ]:
         """
-        Perform a single PPO optimisation step over a batch of trajectories and corresponding advantages and returns.
+        Estimates logprobs and values using the current policy and value models, and calculates the PPO loss.
+        This is compiled as a single graph in ``setup`` if ``compile=True``, so it must not contain any
+        graph breaks, e.g. data-dependent indexing.
 
         Args:
             trajectory (Trajectory): a batch of trajectories
@@ -1099,14 +1619,9 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             context_length (int): input ids sequence length
 
         Returns:
-            PPOStats: An instance of :class:`~torchtune.rlhf.PPOStats`, a NamedTuple containing:
-               - loss (torch.Tensor): The total PPO loss.
-               - policy_loss (torch.Tensor): The policy function loss.
-               - value_loss (torch.Tensor): The value function loss.
-               - ratios (torch.Tensor): The ratio between the current and old policy probabilities.
-               - clipfrac (torch.Tensor): The fraction of ratios that were clipped.
-               - approx_policy_kls: Average estimated KL divergence between the policy before and after the optimisation step.
-
+            tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]: the outputs
+                of the loss function (loss, policy_loss, value_loss, ratios, clipfrac), and the approximate KL
+                divergence between the policy before and after the optimisation step.
         """
         # estimate logprobs from the policy at the current optimisation step
         pi_logits = self._policy_model(
@@ -1118,7 +1633,7 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         pi_logprobs = rlhf.logits_to_logprobs(
             pi_logits, trajectory.query_responses[:, context_length:], self._temperature
         )
-        pi_logprobs[trajectory.response_padding_masks] = 1.0
+        pi_logprobs = pi_logprobs.masked_fill(trajectory.response_padding_masks, 1.0)
 
         del pi_logits
 
@@ -1132,9 +1647,10 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
         phi_values = rlhf.truncate_sequence_for_logprobs(
             phi_values, context_length
         ).squeeze(-1)
-        phi_values[trajectory.value_padding_masks] = 0.0
+        phi_values = phi_values.masked_fill(trajectory.value_padding_masks, 0.0)
 
-        # calculate ppo loss
+        # calculate ppo loss. The padding masks are inverted here rather than stored on the trajectory,
+        # since this is cheaper than gathering extra masks every PPO epoch, and is fused into the loss when compiled
         loss, policy_loss, value_loss, ratios, clipfrac = self._loss_fn(
             trajectory.logprobs,
             pi_logprobs,
@@ -1145,14 +1661,57 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
             padding_masks=~trajectory.response_padding_masks,
             value_padding_masks=~trajectory.value_padding_masks,
         )
+        approx_policy_kls = (
+            0.5 * (pi_logprobs.detach() - trajectory.logprobs).pow(2)
+        ).mean()
+        return loss, policy_loss, value_loss, ratios, clipfrac, approx_policy_kls
 
-        loss /= self._gradient_accumulation_steps
-        loss.backward()
+    def ppo_step(
+        self,
+        trajectory: Trajectory,
+        advantages: torch.Tensor,
+        returns: torch.Tensor,
+        context_length: int,
+    ) -> PPOStats:
+        """
+        Perform a single PPO optimisation step over a batch of trajectories and corresponding advantages and returns.
 
-        with torch.no_grad():
-            approx_policy_kls = (
-                0.5 * (pi_logprobs - trajectory.logprobs).pow(2)
-            ).mean()
+        Args:
+            trajectory (Trajectory): a batch of trajectories
+            advantages (torch.Tensor): advantages corresponding to the trajectories
+            returns (torch.Tensor): returns corresponding the trajectories
+            context_length (int): input ids sequence length
+
+        Returns:
+            PPOStats: An instance of :class:`~torchtune.rlhf.PPOStats`, a NamedTuple containing:
+               - loss (torch.Tensor): The total PPO loss.
+               - policy_loss (torch.Tensor): The policy function loss.
+               - value_loss (torch.Tensor): The value function loss.
+               - ratios (torch.Tensor): The ratio between the current and old policy probabilities.
+               - clipfrac (torch.Tensor): The fraction of ratios that were clipped.
+               - approx_policy_kls: Average estimated KL divergence between the policy before and after the optimisation step.
+
+        """
+        # pre-allocated KV-caches must not be used for the full-sequence forward passes during optimisation
+        with (
+            disable_kv_cache(self._policy_model)
+            if self._kv_cache_preallocated
+            else contextlib.nullcontext()
+        ):
+            if self._cudagraph_ppo_step:
+                # outputs of the previous CUDA graph replay are no longer used once we start a new step
+                torch.compiler.cudagraph_mark_step_begin()
+            (
+                loss,
+                policy_loss,
+                value_loss,
+                ratios,
+                clipfrac,
+                approx_policy_kls,
+            ) = self._ppo_loss_step(trajectory, advantages, returns, context_length)
+
+        loss = loss / self._gradient_accumulation_steps
+        loss.backward()
 
         return PPOStats(
             loss,
@@ -1198,31 +1757,10 @@ class PPOFullFinetuneRecipeSingleDevice(FTRecipeInterface):
 
         self._metric_logger.log_dict(log_dict, step=self.global_step)
 
-    def cleanup_after_step(
-        self,
-        trajectory: Trajectory,
-        ppo_stats: PPOStats,
-        advantages: torch.Tensor,
-        returns: torch.Tensor,
-        kl: torch.Tensor,
-        kl_rewards: torch.Tensor,
-    ) -> None:
-        """
-        Cleanup tensors after each PPO step to free up memory.
-        """
-        # there shouldn't be any floating references to the individual tensors at the this point, so gc can do its thing
-        for v in trajectory:
-            del v
-        del trajectory
-        for v in ppo_stats:
-            del v
-        del ppo_stats
-        del advantages
-        del returns
-        del kl
-        del kl_rewards
-
     def cleanup(self, **kwargs) -> None:
+        self._wait_for_checkpoint()
+        if self._checkpoint_executor is not None:
+            self._checkpoint_executor.shutdown()
         self._metric_logger.close()
 
 
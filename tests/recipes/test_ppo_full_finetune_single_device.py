@@ -190,7 +190,10 @@ class TestPPOFullFinetuneSingleDeviceRecipe:
 
     @pytest.mark.integration_test
     @gpu_test(gpu_count=1)
-    def test_training_state_on_resume(self, tmpdir, monkeypatch):
+    @pytest.mark.parametrize("enable_async_checkpointing", [False, True])
+    def test_training_state_on_resume(
+        self, tmpdir, monkeypatch, enable_async_checkpointing
+    ):
         """Test whether the recipe state correctly saved and restored after training."""
 
         reward_ckpt = "llama2_reward_hf"
@@ -255,6 +258,7 @@ class TestPPOFullFinetuneSingleDeviceRecipe:
             + self._get_test_config_overrides()
             + model_config
             + reward_and_value_model_config
+            + [f"enable_async_checkpointing={enable_async_checkpointing}"]
         )
 
         monkeypatch.setattr(sys, "argv", cmd_1)
@@ -304,6 +308,7 @@ class TestPPOFullFinetuneSingleDeviceRecipe:
             + self._get_test_config_overrides()
             + model_config
             + reward_and_value_model_config
+            + [f"enable_async_checkpointing={enable_async_checkpointing}"]
         )
 
         monkeypatch.setattr(sys, "argv", cmd_2)
@@ -319,7 +324,10 @@ class TestPPOFullFinetuneSingleDeviceRecipe:
 
     @pytest.mark.integration_test
     @gpu_test(gpu_count=1)
-    def test_training_state_on_resume_with_optimizer_in_bwd(self, tmpdir, monkeypatch):
+    @pytest.mark.parametrize("enable_async_checkpointing", [False, True])
+    def test_training_state_on_resume_with_optimizer_in_bwd(
+        self, tmpdir, monkeypatch, enable_async_checkpointing
+    ):
         """Test whether the recipe state correctly saves and restores optimizer state
         when using ``optimizer_in_bwd``, since the optimizer checkpoint dict will include
         parameters for two models.
@@ -385,6 +393,7 @@ class TestPPOFullFinetuneSingleDeviceRecipe:
             + self._get_test_config_overrides()
             + model_config
             + reward_and_value_model_config
+            + [f"enable_async_checkpointing={enable_async_checkpointing}"]
         )
 
         monkeypatch.setattr(sys, "argv", cmd_1)
@@ -436,6 +445,7 @@ class TestPPOFullFinetuneSingleDeviceRecipe:
             + self._get_test_config_overrides()
             + model_config
             + reward_and_value_model_config
+            + [f"enable_async_checkpointing={enable_async_checkpointing}"]
         )
 
         monkeypatch.setattr(sys, "argv", cmd_2)
@@ -448,3 +458,111 @@ class TestPPOFullFinetuneSingleDeviceRecipe:
         torch.testing.assert_close(
             loss_values[6:], resumed_loss_values, rtol=1e-4, atol=1e-4
         )
+
+    @pytest.mark.integration_test
+    @pytest.mark.parametrize(
+        "batch_size_overrides, error_message",
+        [
+            (
+                ["scoring_batch_size=3"],
+                r"batch_size \(4\) must be exactly divisible by scoring_batch_size \(3\)",
+            ),
+            (
+                ["forward_batch_size=2", "scoring_batch_size=1"],
+                r"scoring_batch_size \(1\) must be exactly divisible by forward_batch_size \(2\)",
+            ),
+        ],
+    )
+    def test_invalid_scoring_batch_size(
+        self, tmpdir, monkeypatch, batch_size_overrides, error_message
+    ):
+        """Test that invalid values of ``scoring_batch_size`` are rejected before any models are loaded."""
+        cmd = f"""
+        tune run ppo_full_finetune_single_device \
+            --config mistral/7B_full_ppo_low_memory \
+            output_dir={tmpdir} \
+            device=cpu \
+        """.split()
+        cmd = cmd + self._get_test_config_overrides() + batch_size_overrides
+
+        monkeypatch.setattr(sys, "argv", cmd)
+        with pytest.raises(ValueError, match=error_message):
+            runpy.run_path(TUNE_PATH, run_name="__main__")
+
+    @pytest.mark.integration_test
+    @gpu_test(gpu_count=1)
+    def test_scoring_batch_size_matches_unsplit_trajectory(self, tmpdir, monkeypatch):
+        """Test that scoring trajectories in chunks of ``scoring_batch_size`` gives the same losses
+        as scoring the whole batch at once."""
+
+        reward_ckpt = "llama2_reward_hf"
+        policy_ckpt = "llama2_hf"
+        reward_ckpt_path = Path(CKPT_MODEL_PATHS[reward_ckpt])
+        policy_ckpt_path = Path(CKPT_MODEL_PATHS[policy_ckpt])
+
+        ckpt_dir = policy_ckpt_path.parent
+        write_hf_ckpt_config(ckpt_dir)
+
+        model_config = llama2_test_config()
+        model_config = [k.replace("model.", "policy_model.") for k in model_config]
+        model_config += ["policy_model.intermediate_dim=null"]
+
+        reward_and_value_model_config = llama2_classifier_test_config()
+        reward_and_value_model_config = [
+            k.replace("model.", "reward_and_value_model.")
+            for k in reward_and_value_model_config
+        ]
+        reward_and_value_model_config += [
+            "reward_and_value_model.intermediate_dim=null"
+        ]
+
+        loss_values = {}
+        # batch_size=4, so a scoring_batch_size of 4 takes the unsplit path
+        for scoring_batch_size in (4, 2):
+            run_dir = (tmpdir / f"scoring_batch_size_{scoring_batch_size}").mkdir()
+            log_file = gen_log_file_name(run_dir)
+            policy_tmpdir = (run_dir / "policy").mkdir()
+            value_tmpdir = (run_dir / "value").mkdir()
+            cmd = f"""
+            tune run ppo_full_finetune_single_device \
+                --config mistral/7B_full_ppo_low_memory \
+                output_dir={run_dir} \
+                checkpointer._component_=torchtune.training.FullModelHFCheckpointer \
+                checkpointer.checkpoint_dir='{ckpt_dir}' \
+                checkpointer.checkpoint_files=[{policy_ckpt_path}]\
+                checkpointer.output_dir={policy_tmpdir} \
+                checkpointer.model_type=LLAMA2 \
+
+                ref_policy_checkpointer.checkpoint_dir='{ckpt_dir}' \
+                ref_policy_checkpointer.checkpoint_files=[{policy_ckpt_path}]\
+
+                value_checkpointer.checkpoint_dir='{ckpt_dir}' \
+                value_checkpointer.checkpoint_files=[{reward_ckpt_path}]\
+                value_checkpointer.output_dir={value_tmpdir} \
+
+                reward_checkpointer.checkpoint_dir='{ckpt_dir}' \
+                reward_checkpointer.checkpoint_files=[{reward_ckpt_path}]\
+
+                metric_logger._component_=torchtune.training.metric_logging.DiskLogger \
+                metric_logger.filename={log_file} \
+            """.split()
+            cmd = (
+                cmd
+                + self._get_test_config_overrides()
+                + model_config
+                + reward_and_value_model_config
+                + [
+                    "forward_batch_size=2",
+                    f"scoring_batch_size={scoring_batch_size}",
+                ]
+            )
+
+            monkeypatch.setattr(sys, "argv", cmd)
+            with pytest.raises(SystemExit, match=""):
+                runpy.run_path(TUNE_PATH, run_name="__main__")
+
+            loss_values[scoring_batch_size] = get_loss_values_from_metric_logger(
+                log_file
+            )
+
+        torch.testing.assert_close(loss_values[2], loss_values[4], rtol=1e-4, atol=1e-4)
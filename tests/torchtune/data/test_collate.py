@@ -412,6 +412,16 @@ class TestLeftPadSequence:
         )
         assert torch.equal(result, expected)
 
+    def test_left_pad_sequence_trailing_dims(self):
+        a = torch.tensor([[1, 2]])
+        b = torch.tensor([[3, 4], [5, 6]])
+        result = left_pad_sequence([a, b], batch_first=True, padding_value=-1)
+        expected = torch.tensor([[[-1, -1], [1, 2]], [[3, 4], [5, 6]]])
+        assert torch.equal(result, expected)
+
+        result = left_pad_sequence([a, b], batch_first=False, padding_value=-1)
+        assert torch.equal(result, expected.transpose(0, 1))
+
 
 class TestPaddedCollate:
     def test_throws_error_with_pad_direction_left_and_pad_to_multiple_of(self):
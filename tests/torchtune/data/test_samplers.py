@@ -0,0 +1,62 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+from torchtune.data import LengthBucketedBatchSampler
+
+
+class TestLengthBucketedBatchSampler:
+    lengths = [5, 1, 4, 2, 6, 3, 7]
+
+    def test_batches_are_sorted_by_length(self):
+        batch_sampler = LengthBucketedBatchSampler(
+            range(len(self.lengths)), self.lengths, batch_size=2, shuffle=False
+        )
+        assert list(batch_sampler) == [[1, 3], [5, 2], [0, 4], [6]]
+        assert len(batch_sampler) == 4
+
+    def test_drop_last(self):
+        batch_sampler = LengthBucketedBatchSampler(
+            range(len(self.lengths)),
+            self.lengths,
+            batch_size=2,
+            drop_last=True,
+            shuffle=False,
+        )
+        assert list(batch_sampler) == [[1, 3], [5, 2], [0, 4]]
+        assert len(batch_sampler) == 3
+
+    def test_buckets(self):
+        # each bucket of 4 samples is sorted independently
+        batch_sampler = LengthBucketedBatchSampler(
+            range(len(self.lengths)),
+            self.lengths,
+            batch_size=2,
+            bucket_size_multiplier=2,
+            shuffle=False,
+        )
+        assert list(batch_sampler) == [[1, 3], [2, 0], [5, 4], [6]]
+
+    def test_shuffle(self):
+        batch_sampler = LengthBucketedBatchSampler(
+            range(len(self.lengths)), self.lengths, batch_size=2, seed=0
+        )
+        batches = list(batch_sampler)
+        assert sorted(batches) == [[0, 4], [1, 3], [5, 2], [6]]
+        # shuffling is deterministic for a given epoch
+        assert list(batch_sampler) == batches
+        batch_sampler.set_epoch(1)
+        assert sorted(batch_sampler) == sorted(batches)
+
+    @pytest.mark.parametrize("batch_size, bucket_size_multiplier", [(0, 1), (1, 0)])
+    def test_invalid_sizes(self, batch_size, bucket_size_multiplier):
+        with pytest.raises(ValueError, match="should be a positive integer"):
+            LengthBucketedBatchSampler(
+                range(len(self.lengths)),
+                self.lengths,
+                batch_size=batch_size,
+                bucket_size_multiplier=bucket_size_multiplier,
+            )
@@ -4,6 +4,7 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 
+import pytest
 import torch
 from torchtune import rlhf
 
@@ -179,6 +180,35 @@ class TestEstimateAdvantages:
         _, returns = rlhf.estimate_advantages(values, rewards, gamma, lmbda)
         torch.testing.assert_close(returns, expected_returns, rtol=1e-4, atol=1e-4)
 
+    @pytest.mark.parametrize(
+        "dtype, tol",
+        [(torch.float32, 1e-5), (torch.float64, 1e-5), (torch.bfloat16, 5e-2)],
+    )
+    def test_estimate_returns_matches_recursive_gae(self, dtype, tol):
+        torch.manual_seed(0)
+        values = torch.randn(2, 8, dtype=dtype)
+        rewards = torch.randn(2, 8, dtype=dtype)
+        gamma = 0.9
+        lmbda = 0.95
+
+        # A_t = delta_t + gamma * lambda * A_{t+1}, with V(s_T) = 0, computed in float64
+        values, rewards = values.double(), rewards.double()
+        expected_advantages = torch.zeros_like(values)
+        last_gae_lam = 0.0
+        for t in reversed(range(values.shape[-1])):
+            next_values = values[:, t + 1] if t < values.shape[-1] - 1 else 0.0
+            delta = rewards[:, t] + gamma * next_values - values[:, t]
+            last_gae_lam = delta + gamma * lmbda * last_gae_lam
+            expected_advantages[:, t] = last_gae_lam
+
+        _, returns = rlhf.estimate_advantages(
+            values.to(dtype), rewards.to(dtype), gamma, lmbda
+        )
+        assert returns.dtype == dtype
+        torch.testing.assert_close(
+            returns.double(), expected_advantages + values, rtol=tol, atol=tol
+        )
+
     def test_estimate_advantages_with_whitening(self):
         values = torch.tensor([[0, 0, 0, 1]])
         rewards = torch.tensor([[0, 0, 0, 1]])
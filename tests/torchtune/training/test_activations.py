@@ -0,0 +1,96 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+import torch
+import torch.nn.functional as F
+from torch import nn
+from torch.distributed.algorithms._checkpoint.checkpoint_wrapper import (
+    CheckpointWrapper,
+)
+from torch.utils.checkpoint import CheckpointPolicy
+from torchtune.training import activations, apply_selective_activation_checkpointing
+
+
+class DummyLayer(nn.Module):
+    def __init__(self, dim: int):
+        super().__init__()
+        self.qkv = nn.Linear(dim, 3 * dim)
+        self.mlp = nn.Linear(dim, dim)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        q, k, v = self.qkv(x).chunk(3, dim=-1)
+        x = x + F.scaled_dot_product_attention(q, k, v, is_causal=True)
+        return x + F.silu(self.mlp(x))
+
+
+class DummyModel(nn.Module):
+    def __init__(self, dim: int = 8, num_layers: int = 2):
+        super().__init__()
+        self.layers = nn.ModuleList([DummyLayer(dim) for _ in range(num_layers)])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        for layer in self.layers:
+            x = layer(x)
+        return x
+
+
+class TestApplySelectiveActivationCheckpointing:
+    @pytest.mark.parametrize(
+        "ac_mode, ac_option", [("full", None), ("selective", "op")]
+    )
+    def test_grads_match_no_ac(self, ac_mode, ac_option):
+        torch.manual_seed(0)
+        model = DummyModel()
+        ac_model = DummyModel()
+        ac_model.load_state_dict(model.state_dict())
+        apply_selective_activation_checkpointing(ac_model, ac_mode, ac_option)
+
+        for layer in ac_model.layers:
+            assert isinstance(layer, CheckpointWrapper)
+
+        x = torch.randn(2, 4, 8)
+        model(x).sum().backward()
+        ac_model(x).sum().backward()
+
+        for (name, p), (ac_name, ac_p) in zip(
+            model.named_parameters(), ac_model.named_parameters()
+        ):
+            torch.testing.assert_close(p.grad, ac_p.grad, msg=f"{name} != {ac_name}")
+
+    def test_selective_op_ac_saves_matmuls_and_attention(self, monkeypatch):
+        policy_calls = []
+        selective_op_policy = activations._selective_op_policy
+
+        def recording_policy(ctx, func, *args, **kwargs):
+            policy = selective_op_policy(ctx, func, *args, **kwargs)
+            policy_calls.append((func, policy))
+            return policy
+
+        monkeypatch.setattr(activations, "_selective_op_policy", recording_policy)
+        ac_model = DummyModel()
+        apply_selective_activation_checkpointing(ac_model, "selective", "op")
+
+        ac_model(torch.randn(2, 4, 8))
+
+        saved = [
+            func
+            for func, policy in policy_calls
+            if policy == CheckpointPolicy.MUST_SAVE
+        ]
+        recomputed = [
+            func
+            for func, policy in policy_calls
+            if policy == CheckpointPolicy.PREFER_RECOMPUTE
+        ]
+        assert set(saved) <= activations._SAC_SAVE_LIST
+        # each layer has two linear layers, whose matmuls are saved
+        linear_ops = {torch.ops.aten.mm.default, torch.ops.aten.addmm.default}
+        assert sum(func in linear_ops for func in saved) == 4
+        # attention is saved in each layer, either as a fused kernel or as the math fallback's matmuls
+        assert sum(func not in linear_ops for func in saved) >= 2
+        # cheaper ops, e.g. silu and residual adds, are recomputed
+        assert recomputed
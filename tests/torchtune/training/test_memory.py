@@ -46,6 +46,29 @@ class TestSetActivationCheckpointing:
         set_activation_checkpointing(model=model, auto_wrap_policy=custom_policy)
         self._verify(model)
 
+    def test_activation_checkpoint_not_applied_twice(self, model):
+        set_activation_checkpointing(model=model, auto_wrap_policy={nn.Linear})
+        set_activation_checkpointing(model=model, auto_wrap_policy={nn.Linear})
+        self._verify(model)
+        num_wrappers = sum(isinstance(m, CheckpointWrapper) for m in model.modules())
+        assert num_wrappers == 3
+
+    def test_activation_checkpoint_skips_wrapped_modules(self, model):
+        set_activation_checkpointing(
+            model=model,
+            auto_wrap_policy=lambda module, recurse, **kwargs: recurse
+            or module is model[0],
+        )
+        set_activation_checkpointing(model=model, auto_wrap_policy={nn.Linear, nn.ReLU})
+        # the already wrapped module isn't wrapped again, but all other modules are still wrapped
+        assert isinstance(model[0]._checkpoint_wrapped_module, nn.Linear)
+        for idx in (1, 2, 3):
+            assert isinstance(model[idx], CheckpointWrapper)
+            assert not isinstance(
+                model[idx]._checkpoint_wrapped_module, CheckpointWrapper
+            )
+        assert not isinstance(model[4], CheckpointWrapper)
+
 
 def _run_dummy_step(model, wrapper):
     with torch.no_grad():
@@ -23,8 +23,11 @@ class TestDisableDropout:
         )
         disable_dropout(model)
         for module in model.modules():
-            if isinstance(module, torch.nn.Dropout):
-                assert module.p == 0, f"Dropout layer {module} was not disabled."
+            assert not isinstance(
+                module, torch.nn.Dropout
+            ), f"Dropout layer {module} was not disabled."
+        assert isinstance(model[1], torch.nn.Identity)
+        assert isinstance(model[3], torch.nn.Identity)
 
     def test_disable_dropout_warning(self):
         """
@@ -32,6 +32,7 @@ from torchtune.data._prompt_templates import (
     QuestionAnswerTemplate,
     SummarizeTemplate,
 )
+from torchtune.data._samplers import LengthBucketedBatchSampler
 from torchtune.data._utils import format_content_with_images, load_image, truncate
 
 __all__ = [
@@ -59,5 +60,6 @@ __all__ = [
     "padded_collate",
     "padded_collate_tiled_images_and_mask",
     "padded_collate_packed",
+    "LengthBucketedBatchSampler",
     "load_image",
 ]
@@ -46,11 +46,22 @@ def left_pad_sequence(
                 [ 0,  4,  5,  6,  7],
                 [ 8,  9, 10, 11, 12]])
     """
-    return pad_sequence(
-        map(lambda x: torch.flip(x, dims=[0]), sequences),
-        batch_first=batch_first,
-        padding_value=padding_value,
-    ).flip(dims=[int(batch_first)])
+    max_len = max(seq.size(0) for seq in sequences)
+    trailing_dims = sequences[0].shape[1:]
+    out_shape = (
+        (len(sequences), max_len, *trailing_dims)
+        if batch_first
+        else (max_len, len(sequences), *trailing_dims)
+    )
+    # allocate the output once and copy each sequence into its right-aligned slice,
+    # rather than flipping every sequence, padding, and flipping the padded output
+    out = sequences[0].new_full(out_shape, padding_value)
+    for i, seq in enumerate(sequences):
+        if batch_first:
+            out[i, max_len - seq.size(0) :] = seq
+        else:
+            out[max_len - seq.size(0) :, i] = seq
+    return out
 
 
 def padded_collate(
@@ -0,0 +1,108 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from typing import Iterator, Sequence
+
+import torch
+from torch.utils.data import Sampler
+
+
+class LengthBucketedBatchSampler(Sampler[list[int]]):
+    """
+    Batch sampler which groups samples of similar lengths into the same batch, reducing the amount of
+    padding in each batch. Indices are drawn from ``sampler`` in buckets of ``batch_size * bucket_size_multiplier``
+    samples, and each bucket is sorted by length and split into batches. If ``shuffle=True``, the order of
+    batches within each bucket is shuffled so batches are not yielded from shortest to longest.
+
+    Example:
+        >>> lengths = [5, 1, 4, 2, 6, 3]
+        >>> batch_sampler = LengthBucketedBatchSampler(
+        >>>     range(len(lengths)), lengths, batch_size=2, shuffle=False
+        >>> )
+        >>> list(batch_sampler)
+        [[1, 3], [5, 2], [0, 4]]
+
+    Args:
+        sampler (Sampler[int]): sampler which yields dataset indices, e.g.
+            :class:`~torchdata.stateful_dataloader.sampler.StatefulDistributedSampler`.
+        lengths (Sequence[int]): length of every sample in the dataset.
+        batch_size (int): number of samples in each batch.
+        bucket_size_multiplier (int): number of batches in each bucket. Larger values reduce padding,
+            at the cost of less random batches. Default is 100.
+        drop_last (bool): whether to drop the last batch if it is smaller than ``batch_size``. Default is False.
+        shuffle (bool): whether to shuffle the order of batches within each bucket. Default is True.
+        seed (int): random seed used to shuffle batches. Default is 0.
+
+    Raises:
+        ValueError: if ``batch_size`` or ``bucket_size_multiplier`` is not a positive integer.
+    """
+
+    def __init__(
+        self,
+        sampler: Sampler[int],
+        lengths: Sequence[int],
+        batch_size: int,
+        bucket_size_multiplier: int = 100,
+        drop_last: bool = False,
+        shuffle: bool = True,
+        seed: int = 0,
+    ) -> None:
+        if batch_size <= 0:
+            raise ValueError(
+                f"batch_size should be a positive integer, but got {batch_size}."
+            )
+        if bucket_size_multiplier <= 0:
+            raise ValueError(
+                "bucket_size_multiplier should be a positive integer, "
+                f"but got {bucket_size_multiplier}."
+            )
+        self.sampler = sampler
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.bucket_size_multiplier = bucket_size_multiplier
+        self.drop_last = drop_last
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __iter__(self) -> Iterator[list[int]]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        bucket_size = self.batch_size * self.bucket_size_multiplier
+        indices = list(self.sampler)
+        for bucket_start in range(0, len(indices), bucket_size):
+            bucket = sorted(
+                indices[bucket_start : bucket_start + bucket_size],
+                key=lambda idx: self.lengths[idx],
+            )
+            batches = [
+                bucket[i : i + self.batch_size]
+                for i in range(0, len(bucket), self.batch_size)
+            ]
+            if self.drop_last and len(batches[-1]) < self.batch_size:
+                batches.pop()
+            if self.shuffle:
+                batches = [
+                    batches[i]
+                    for i in torch.randperm(len(batches), generator=generator).tolist()
+                ]
+            yield from batches
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return len(self.sampler) // self.batch_size
+        return (len(self.sampler) + self.batch_size - 1) // self.batch_size
+
+    def set_epoch(self, epoch: int) -> None:
+        """
+        Sets the epoch for this sampler, and for ``sampler`` if it supports it. This ensures
+        batches are shuffled differently across epochs when ``shuffle=True``.
+
+        Args:
+            epoch (int): epoch number.
+        """
+        self.epoch = epoch
+        if hasattr(self.sampler, "set_epoch"):
+            self.sampler.set_epoch(epoch)
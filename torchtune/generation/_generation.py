@@ -257,7 +257,12 @@ def generate(
     bsz, prompt_length = prompt.size()
     total_response_length = prompt_length + max_generated_tokens
 
-    generated_tokens = prompt.clone()
+    # generated tokens and logits are written in-place into buffers sized for the maximum number
+    # of generated tokens, rather than concatenated after every decoding step, which would copy
+    # all previously generated tokens and logits at every step
+    generated_tokens = torch.nn.functional.pad(
+        prompt, (0, max_generated_tokens), value=pad_id
+    )
     incremental_decoding = model.caches_are_enabled()
 
     # grab the correct max_seq_len to generate full causal masks/position ids
@@ -269,7 +274,7 @@ def generate(
         else model.decoder_max_cache_seq_len
     )
 
-    padding_masks = generated_tokens != pad_id
+    padding_masks = prompt != pad_id
 
     if not padding_masks.all():
         # we have padding in the prompt due to varying-length sequences in a batch
@@ -320,7 +325,7 @@ def generate(
         condition = uniform_val >= 1.0 - epsilon
         q = -torch.where(condition, -epsilon, torch.log(uniform_val))
 
-    tokens, generated_logits = generate_next_token(
+    tokens, logits = generate_next_token(
         model,
         input_pos=input_pos[:, :prompt_length].squeeze(),
         mask=curr_masks,
@@ -330,9 +335,10 @@ def generate(
         q=q,
     )
 
-    generated_tokens = torch.cat([generated_tokens, tokens], dim=-1)
-
     curr_pos = prompt_length
+    generated_tokens[:, curr_pos] = tokens.squeeze(-1)
+    generated_logits = logits.new_empty((bsz, max_generated_tokens, logits.shape[-1]))
+    generated_logits[:, 0] = logits.squeeze(1)
 
     # keeps track at a high level if we've already hit a stop token in a sequence so we can early stop
     stop_token_reached = torch.zeros(bsz, dtype=torch.bool, device=prompt.device)
@@ -345,7 +351,7 @@ def generate(
     # everything in stop_token_mask starts as 1s, and we'll set them to 0 for sequences
     # that already hit a stop token
     stop_token_mask = torch.ones(
-        (bsz, prompt_length + 1), dtype=torch.int32, device=prompt.device
+        (bsz, total_response_length), dtype=torch.int32, device=prompt.device
     )
 
     # stop early if we reach a stop token in every seq
@@ -354,16 +360,16 @@ def generate(
             tokens, stop_tokens, stop_token_reached
         )
         if stop_token_reached.all().item():
-            return generated_tokens, generated_logits
+            return (
+                generated_tokens[:, : curr_pos + 1].contiguous(),
+                generated_logits[:, :1].contiguous(),
+            )
 
     for _ in range(max_generated_tokens - 1):
         # update stop_token_mask if we reached a stop token in a previous step
-        # by appending the logical not of stop_token_reached to the end of the mask
-        # reshaped to be bsz first
+        # by setting the logical not of stop_token_reached at the next position in the mask
         if stop_tokens is not None:
-            stop_token_mask = torch.cat(
-                [stop_token_mask, ~stop_token_reached.reshape(bsz, 1)], dim=-1
-            )
+            stop_token_mask[:, curr_pos + 1] = ~stop_token_reached
 
         # if incremental decoding is enabled, we can use the current position
         # otherwise, we take the whole sequence up to the current position
@@ -371,7 +377,7 @@ def generate(
             curr_input_pos = input_pos[:, curr_pos].contiguous()
             curr_masks = masks[:, curr_pos, None, :].contiguous()
         else:
-            tokens = generated_tokens.clone()
+            tokens = generated_tokens[:, : curr_pos + 1]
             curr_input_pos = input_pos[:, : curr_pos + 1]
             curr_masks = masks[:, : curr_pos + 1, : curr_pos + 1]
 
@@ -396,9 +402,9 @@ def generate(
             top_k=top_k,
             q=q,
         )
-        generated_tokens = torch.cat([generated_tokens, tokens], dim=-1)
-        generated_logits = torch.cat([generated_logits, logits], dim=1)
         curr_pos += 1
+        generated_tokens[:, curr_pos] = tokens.squeeze(-1)
+        generated_logits[:, curr_pos - prompt_length] = logits.squeeze(1)
 
         if stop_tokens is not None:
             stop_token_reached = update_stop_tokens_tracker(
@@ -407,6 +413,14 @@ def generate(
             if stop_token_reached.all():
                 break
 
+    # trim the outputs if generation stopped early
+    if curr_pos + 1 < total_response_length:
+        generated_tokens = generated_tokens[:, : curr_pos + 1].contiguous()
+        generated_logits = generated_logits[
+            :, : curr_pos + 1 - prompt_length
+        ].contiguous()
+        stop_token_mask = stop_token_mask[:, : curr_pos + 1]
+
     # mask out generated tokens in seqs that already hit a stop token
     if stop_tokens is not None:
         generated_tokens *= stop_token_mask
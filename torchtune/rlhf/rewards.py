@@ -7,6 +7,7 @@
 from typing import Optional
 
 import torch
+import torch.nn.functional as F
 
 
 def get_reward_penalty_mask(
@@ -206,24 +207,28 @@ def estimate_advantages(
         - response_len: model response length
     """
 
-    last_gae_lam = 0
-    advantages_reversed = []
-
     response_length = values.shape[-1]
 
-    # estimate advantage for every predicted token position
-    for t in reversed(range(response_length)):
-        # value of the next state
-        next_values = values[:, t + 1] if t < response_length - 1 else 0.0
-        # exponentially discounted temporal difference error:
-        # delta_t = r_t + gamma * V(s_{t+1}) - V(s_t)
-        delta = rewards[:, t] + gamma * next_values - values[:, t]
-        # GAE-Lambda advantage discounting saved for the next iteration
-        # as A_t = delta_t + gamma * lambda * A_{t+1} + ...
-        last_gae_lam = delta + gamma * lmbda * last_gae_lam
-        advantages_reversed.append(last_gae_lam)
-
-    advantages = torch.stack(advantages_reversed[::-1], axis=1)
+    # exponentially discounted temporal difference errors for every predicted token position:
+    # delta_t = r_t + gamma * V(s_{t+1}) - V(s_t), where the value after the last position is 0
+    next_values = F.pad(values[:, 1:], (0, 1))
+    deltas = rewards + gamma * next_values - values
+
+    # GAE-Lambda advantages A_t = delta_t + gamma * lambda * A_{t+1} unroll to
+    # A_t = sum_{k >= t} (gamma * lambda)^(k - t) * delta_k, so rather than a sequential loop over
+    # every position, all advantages are computed at once as a reduction with a lower-triangular
+    # discount matrix. This is done in at least float32, and as an elementwise product and sum rather
+    # than a matmul so that TF32 matmuls don't reduce precision
+    compute_dtype = torch.promote_types(deltas.dtype, torch.float32)
+    positions = torch.arange(response_length, device=values.device)
+    offsets = (positions[:, None] - positions[None, :]).clamp(min=0)
+    discounts = torch.pow(
+        torch.tensor(gamma * lmbda, dtype=compute_dtype, device=values.device),
+        offsets,
+    ).tril()
+    advantages = (
+        (deltas.to(compute_dtype).unsqueeze(-1) * discounts).sum(-2).to(deltas.dtype)
+    )
 
     # returns are the expected value of taking action a_t at each timepoint over
     # a trajectory. the value estimates v_t are the expected value over all actions
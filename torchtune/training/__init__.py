@@ -42,6 +42,7 @@ from torchtune.training.activations import apply_selective_activation_checkpoint
 from torchtune.training.checkpointing import (
     ADAPTER_CONFIG,
     ADAPTER_KEY,
+    CPU_RNG_KEY,
     Checkpointer,
     DATALOADER_KEY,
     DistributedCheckpointer,
@@ -96,6 +97,7 @@ __all__ = [
     "ADAPTER_CONFIG",
     "ParallelDims",
     "ADAPTER_KEY",
+    "CPU_RNG_KEY",
     "EPOCHS_KEY",
     "MAX_STEPS_KEY",
     "MODEL_KEY",
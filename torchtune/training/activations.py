@@ -4,18 +4,45 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 
+from functools import partial
 from typing import Optional, Union
 
+import torch
 from torch import nn
 from torch.distributed.algorithms._checkpoint.checkpoint_wrapper import (
     checkpoint_wrapper as ptd_checkpoint_wrapper,
     CheckpointImpl,
+    CheckpointWrapper,
 )
-from torch.utils.checkpoint import checkpoint
+from torch.utils.checkpoint import (
+    checkpoint,
+    CheckpointPolicy,
+    create_selective_checkpoint_contexts,
+)
+
+# ops whose outputs are saved for backward with selective op AC. Matmuls and attention have the
+# highest compute cost per byte of activation memory, so only cheaper ops (e.g. pointwise ops and
+# norms) are recomputed during the backward pass
+_SAC_SAVE_LIST = {
+    torch.ops.aten.mm.default,
+    torch.ops.aten.addmm.default,
+    # the math SDPA fallback decomposes attention into batched matmuls
+    torch.ops.aten.bmm.default,
+    torch.ops.aten._scaled_dot_product_cudnn_attention.default,
+    torch.ops.aten._scaled_dot_product_efficient_attention.default,
+    torch.ops.aten._scaled_dot_product_flash_attention.default,
+    torch.ops.aten._scaled_dot_product_flash_attention_for_cpu.default,
+}
+
+
+def _selective_op_policy(ctx, func, *args, **kwargs) -> CheckpointPolicy:
+    if func in _SAC_SAVE_LIST:
+        return CheckpointPolicy.MUST_SAVE
+    return CheckpointPolicy.PREFER_RECOMPUTE
 
 
 # Uses PTD FSDP AC wrapper
-# currently selective per layer checkpointing are supported
+# currently selective per layer and per op checkpointing are supported
 def checkpoint_wrapper(module, ac_mode, ac_style):
     if ac_mode == "full":
         return ptd_checkpoint_wrapper(
@@ -26,6 +53,19 @@ def checkpoint_wrapper(module, ac_mode, ac_style):
             preserve_rng_state=False,
         )
 
+    # selective op checkpointing, saving the outputs of ops in _SAC_SAVE_LIST
+    elif ac_mode == "selective" and ac_style == "op":
+        return ptd_checkpoint_wrapper(
+            module,
+            checkpoint_impl=CheckpointImpl.NO_REENTRANT,
+            checkpoint_fn=checkpoint,
+            use_reentrant=False,
+            preserve_rng_state=False,
+            context_fn=partial(
+                create_selective_checkpoint_contexts, _selective_op_policy
+            ),
+        )
+
     # selective layer checkpointing...some checks in case we receive '2' or 2...
     elif ac_mode == "selective":
         """enables selective checkpointing of candidate layers.
@@ -74,11 +114,16 @@ def apply_selective_activation_checkpointing(
         ac_mode (str): Activation checkpointing mode. ['none', 'full', 'selective']
         ac_option (Optional[Union[int, str]]): Activation checkpointing option. If ac_mode is
             "selective", ac_option can be an integer or a string representing the number of layers
-            to checkpoint. If ac_mode is "selective" and ac_option is "op", then selective op ac is run.
-            If ac_mode is "none" or "full", ac_option is ignored.
+            to checkpoint. If ac_mode is "selective" and ac_option is "op", then selective op ac is run,
+            where the outputs of matmuls and attention are saved and all other ops are recomputed during
+            the backward pass. If ac_mode is "none" or "full", ac_option is ignored.
     """
 
     for layer_id, transformer_block in enumerate(model.layers):
+        # avoid wrapping layers which are already checkpointed, since nested
+        # checkpoint wrappers recompute the forward pass twice during backward
+        if isinstance(transformer_block, CheckpointWrapper):
+            continue
         if ac_mode in ("full", "selective"):
             transformer_block = checkpoint_wrapper(
                 transformer_block,
@@ -14,6 +14,7 @@ from torchtune.training.checkpointing._checkpointer import (
 from torchtune.training.checkpointing._utils import (
     ADAPTER_CONFIG,
     ADAPTER_KEY,
+    CPU_RNG_KEY,
     DATALOADER_KEY,
     EPOCHS_KEY,
     FormattedCheckpointFiles,
@@ -47,6 +48,7 @@ __all__ = [
     "ADAPTER_CONFIG",
     "get_largest_iter_folder",
     "ADAPTER_KEY",
+    "CPU_RNG_KEY",
     "EPOCHS_KEY",
     "MAX_STEPS_KEY",
     "MODEL_KEY",
@@ -73,6 +73,9 @@ STEPS_KEY = "steps_run"
 # rng state for ensuring correct training resuming in PPO
 RNG_KEY = "rng_state"
 
+# state of the CPU rng used to shuffle trajectories in PPO
+CPU_RNG_KEY = "cpu_rng_state"
+
 # key used for dataloader state
 DATALOADER_KEY = "dataloader"
 
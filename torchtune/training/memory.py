@@ -6,6 +6,7 @@
 
 import gc
 import logging
+from functools import partial
 
 from typing import Any, Callable, Union
 
@@ -13,8 +14,9 @@ import torch
 from torch import nn
 from torch.distributed.algorithms._checkpoint.checkpoint_wrapper import (
     apply_activation_checkpointing,
+    CheckpointWrapper,
 )
-from torch.distributed.fsdp.wrap import ModuleWrapPolicy
+from torch.distributed.fsdp.wrap import lambda_auto_wrap_policy, ModuleWrapPolicy
 from torch.optim.lr_scheduler import LRScheduler
 from torchtune.utils import get_device_support, get_logger, get_torch_device_namespace
 
@@ -37,10 +39,43 @@ def set_activation_checkpointing(
             policies, please see this tutorial:
             https://pytorch.org/tutorials/intermediate/FSDP_adavnced_tutorial.html#transformer-wrapping-policy.
         **kwargs: additional arguments to pass to ``torch.distributed`` activation checkpointing.
+
+    Note:
+        Submodules of ``model`` which have already been wrapped with activation checkpointing, and any modules
+        inside them, are skipped, since nested checkpoint wrappers would recompute the forward pass of the
+        wrapped modules twice during the backward pass.
     """
+    already_wrapped = {
+        submodule
+        for module in model.modules()
+        if isinstance(module, CheckpointWrapper)
+        for submodule in module.modules()
+    }
+    if not already_wrapped:
+        if isinstance(auto_wrap_policy, set):
+            auto_wrap_policy = ModuleWrapPolicy(auto_wrap_policy)
+        apply_activation_checkpointing(
+            model, auto_wrap_policy=auto_wrap_policy, **kwargs
+        )
+        return
+
     if isinstance(auto_wrap_policy, set):
-        auto_wrap_policy = ModuleWrapPolicy(auto_wrap_policy)
-    apply_activation_checkpointing(model, auto_wrap_policy=auto_wrap_policy, **kwargs)
+        module_types = tuple(auto_wrap_policy)
+        policy = partial(
+            lambda_auto_wrap_policy, lambda_fn=lambda m: isinstance(m, module_types)
+        )
+    else:
+        policy = auto_wrap_policy
+
+    def skip_wrapped_policy(module: nn.Module, recurse: bool, **policy_kwargs) -> bool:
+        # don't wrap, or recurse into, modules which already have activation checkpointing applied
+        if module in already_wrapped:
+            return False
+        return policy(module=module, recurse=recurse, **policy_kwargs)
+
+    apply_activation_checkpointing(
+        model, auto_wrap_policy=skip_wrapped_policy, **kwargs
+    )
 
 
 def cleanup_before_training() -> None: